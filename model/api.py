@@ -1,57 +1,224 @@
 from flask import Flask, request, jsonify
 import os
 import uuid
+import hmac
+import json
+import time
+import threading
+import numpy as np
 import torch
 from model import MultiDomainPronunciationTrainer
+from profiling import RequestProfiler
 from flask import Flask
 from flask_cors import CORS
+from flask_sock import Sock
+
+# Reference point for the time-to-first-bind and time-to-ready log lines
+PROCESS_START = time.monotonic()
 
 app = Flask(__name__)
 CORS(app)  # Enables CORS for all routes
+sock = Sock(app)  # WebSocket support for live streaming analysis
 
 # Your routes
 
 
 # --- MODEL LOADING (PRODUCTION WORKFLOW) ---
+# Loading and warming up Wav2Vec2 takes tens of seconds, so it happens on a
+# background thread. The WSGI server can bind its port straight away, and
+# orchestrators can watch /healthz and /readyz while the model comes up.
 print("🚀 Initializing model for production...")
 
 # 1. Initialize the trainer. At this point, trainer.model is still None.
 trainer = MultiDomainPronunciationTrainer()
 
-# 2. Load the base pre-trained model architecture from Hugging Face.
-#    This is the crucial step that creates the actual model object.
-trainer.load_and_initialize_model()
-
-# 3. NOW that the model exists, load your custom fine-tuned weights from the .pth file.
-#    This step overwrites the base weights with your specialized ones.
-try:
-    print("✅ Base model loaded. Attempting to load fine-tuned state from 'model_state.pth'...")
-    trainer.model.load_state_dict(torch.load('model_state.pth'))
-    print("✅ Successfully loaded fine-tuned weights. The model is now specialized.")
-except FileNotFoundError:
-    print("⚠️  'model_state.pth' not found. The API will run using the standard pre-trained model.")
-except Exception as e:
-    print(f"❌ Error loading 'model_state.pth': {e}. The API will run using the standard pre-trained model.")
-
-print("✅ Model is fully loaded and ready to serve requests.")
+# Shared startup state reported by /readyz. Only the loader thread writes to it.
+model_status = {
+    "ready": False,
+    "stage": "starting",
+    "weights": None,
+    "error": None,
+    "time_to_ready_seconds": None
+}
+
+# Seconds a client should wait before retrying /analyze while the model loads
+RETRY_AFTER_SECONDS = 5
+
+# Optional fast-model cascade, configured from the environment. Only clean readings keep the
+# fast result; low fast-tier confidence or word accuracy is escalated to the full model.
+CASCADE_ENABLED = os.environ.get('CASCADE_ENABLED', '0') == '1'
+CASCADE_FAST_MODEL = os.environ.get('CASCADE_FAST_MODEL') or None
+CASCADE_FAST_LAYERS = int(os.environ.get('CASCADE_FAST_LAYERS', '6'))
+CASCADE_MIN_CONFIDENCE = float(os.environ.get('CASCADE_MIN_CONFIDENCE', '0.85'))
+CASCADE_MIN_ACCURACY = float(os.environ.get('CASCADE_MIN_ACCURACY', '85'))
+
+# Upper bound on a single live streaming session, in seconds of audio
+MAX_STREAM_SECONDS = 120
+
+# Sample rates accepted on /stream. Arbitrary rates can make the resampling kernel huge.
+SUPPORTED_STREAM_SAMPLE_RATES = (8000, 16000, 22050, 32000, 44100, 48000)
+
+# Largest single WebSocket message: a few seconds of float32 audio at the highest supported rate
+MAX_STREAM_MESSAGE_SECONDS = 4
+app.config['SOCK_SERVER_OPTIONS'] = {
+    'max_message_size': MAX_STREAM_MESSAGE_SECONDS * max(SUPPORTED_STREAM_SAMPLE_RATES) * 4
+}
+
+
+def _load_model_in_background():
+    """Load the base model, apply the fine-tuned weights and warm up, off the request path."""
+    load_started = time.monotonic()
+    try:
+        # 2. Load the base pre-trained model architecture from Hugging Face.
+        #    This is the crucial step that creates the actual model object.
+        #    The warm-up passes run inside load_and_initialize_model().
+        model_status["stage"] = "loading_model"
+        trainer.load_and_initialize_model()
+
+        # 3. NOW that the model exists, load your custom fine-tuned weights from the .pth file.
+        #    This step overwrites the base weights with your specialized ones.
+        model_status["stage"] = "loading_weights"
+        try:
+            print("✅ Base model loaded. Attempting to load fine-tuned state from 'model_state.pth'...")
+            trainer.model.load_state_dict(torch.load('model_state.pth'))
+            model_status["weights"] = "fine-tuned (model_state.pth)"
+            print("✅ Successfully loaded fine-tuned weights. The model is now specialized.")
+        except FileNotFoundError:
+            model_status["weights"] = "pre-trained (facebook/wav2Vec2-base-960h)"
+            print("⚠️  'model_state.pth' not found. The API will run using the standard pre-trained model.")
+        except Exception as e:
+            model_status["weights"] = "pre-trained (facebook/wav2Vec2-base-960h)"
+            print(f"❌ Error loading 'model_state.pth': {e}. The API will run using the standard pre-trained model.")
+
+        # 4. Build the fast tier from the final weights, if the cascade is enabled.
+        if CASCADE_ENABLED:
+            model_status["stage"] = "building_cascade"
+            trainer.enable_cascade(fast_model_name=CASCADE_FAST_MODEL, fast_num_layers=CASCADE_FAST_LAYERS,
+                                   min_confidence=CASCADE_MIN_CONFIDENCE,
+                                   min_word_accuracy=CASCADE_MIN_ACCURACY)
+
+        model_status["time_to_ready_seconds"] = round(time.monotonic() - PROCESS_START, 2)
+        model_status["stage"] = "ready"
+        model_status["ready"] = True
+        print(f"✅ Model is fully loaded and ready to serve requests "
+              f"(load took {time.monotonic() - load_started:.2f}s, "
+              f"time-to-ready {model_status['time_to_ready_seconds']:.2f}s).")
+    except Exception as e:
+        model_status["stage"] = "failed"
+        model_status["error"] = str(e)
+        print(f"❌ Model failed to load: {e}. /healthz will report failure so the process gets restarted.")
+
+
+loader_thread = threading.Thread(target=_load_model_in_background, name="model-loader", daemon=True)
+loader_thread.start()
 # --------------------------------------------------
 
+# On-demand request profiling. Disarmed by default; the admin endpoint below arms it.
+# Set PROFILING_ADMIN_TOKEN to enable the endpoint at all.
+PROFILING_ADMIN_TOKEN = os.environ.get('PROFILING_ADMIN_TOKEN')
+profiler = RequestProfiler(output_dir=os.environ.get('PROFILING_OUTPUT_DIR', 'profiles'))
+
 # Create a temporary folder for audio uploads
 UPLOAD_FOLDER = 'temp_audio'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness probe. Answers as soon as the process can serve HTTP, even while the model loads.
+    Returns 500 once loading has failed, since nothing retries it and the orchestrator
+    should restart the process.
+    """
+    if model_status["stage"] == "failed":
+        return jsonify({"status": "failed", "error": model_status["error"], "success": False}), 500
+    return jsonify({"status": "alive", "success": True})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness probe. Returns 200 once the model is loaded and warmed up, 503 before that.
+    The body reports the loading stage and which weights are active.
+    """
+    body = {
+        "ready": model_status["ready"],
+        "stage": model_status["stage"],
+        "weights": model_status["weights"],
+        "cascade": trainer.cascade_settings,
+        "time_to_ready_seconds": model_status["time_to_ready_seconds"],
+        "success": model_status["ready"]
+    }
+    if model_status["error"]:
+        body["error"] = model_status["error"]
+    if model_status["ready"]:
+        return jsonify(body)
+    return jsonify(body), 503
+
+
+def _not_ready_response():
+    """Fast 503 with Retry-After for requests that arrive before the model is ready."""
+    response = jsonify({
+        "error": "The pronunciation model is still loading. Please retry shortly.",
+        "stage": model_status["stage"],
+        "success": False
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route('/metrics/cascade', methods=['GET'])
+def cascade_metrics():
+    """Escalation rate and latency savings of the fast-model cascade"""
+    return jsonify({**trainer.get_cascade_metrics(), "success": True})
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def admin_profiling():
+    """
+    Admin-only control for request profiling. Requires the 'X-Admin-Token' header.
+    - GET returns the profiler status.
+    - POST with JSON {"requests": N} captures the next N /analyze requests, and/or
+      {"sample_rate": 0.05} captures a random fraction of them. Both 0 disarms it.
+    Captures are written to PROFILING_OUTPUT_DIR as Chrome traces (.trace.json),
+    collapsed stacks for flamegraphs (.folded) and a JSON summary with stage timings.
+    """
+    if not PROFILING_ADMIN_TOKEN:
+        return jsonify({"error": "Profiling is not enabled on this server", "success": False}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), PROFILING_ADMIN_TOKEN):
+        return jsonify({"error": "Invalid admin token", "success": False}), 403
+
+    if request.method == 'POST':
+        settings = request.get_json(silent=True) or {}
+        try:
+            profiler.configure(requests=int(settings.get('requests', 0)),
+                               sample_rate=float(settings.get('sample_rate', 0.0)))
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": str(e), "success": False}), 400
+        print(f"🔬 Profiling configured: {profiler.status()}")
+
+    return jsonify({**profiler.status(), "success": True})
+
+
 @app.route('/analyze', methods=['POST'])
 def analyze_audio():
     """
     API endpoint for pronunciation analysis. Expects a multipart form with:
     - 'audio_file': The .wav audio file.
     - 'domain': The practice domain (e.g., 'SOCIAL').
-    - 'paragraph_number': The paragraph number (e.g., 1).
+    - 'paragraph_number': The paragraph number (e.g., 1), or 'auto' for open practice.
+      With 'auto' the paragraph that was read is detected within 'domain', or across
+      all domains when 'domain' is omitted or 'ALL'.
+    - 'detect_paragraph' (optional): 'true' to detect the paragraph even when a number is
+      sent, in case the client sent the wrong one. If detection is unclear, the sent
+      paragraph is analyzed as usual with 'paragraph_detection.detected' set to false.
     """
     # --- This variable needs to be defined to be accessible in the finally block ---
     temp_filename = None
+    if not model_status["ready"]:
+        return _not_ready_response()
     try:
         # --- Input Validation ---
         if 'audio_file' not in request.files:
@@ -63,26 +230,50 @@ def analyze_audio():
 
         if not audio_file or audio_file.filename == '':
             return jsonify({"error": "No selected audio file", "success": False}), 400
-        if not domain or not paragraph_number_str:
+        open_practice = (paragraph_number_str or '').lower() == 'auto'
+        auto_detect = open_practice or request.form.get('detect_paragraph', '').lower() == 'true'
+        if not open_practice and (not domain or not paragraph_number_str):
             return jsonify({"error": "Both 'domain' and 'paragraph_number' are required fields", "success": False}), 400
 
-        try:
-            paragraph_number = int(paragraph_number_str)
-        except (ValueError, TypeError):
-            return jsonify({"error": "'paragraph_number' must be a valid integer", "success": False}), 400
+        paragraph_number = None
+        if paragraph_number_str and paragraph_number_str.lower() != 'auto':
+            try:
+                paragraph_number = int(paragraph_number_str)
+            except (ValueError, TypeError):
+                return jsonify({"error": "'paragraph_number' must be a valid integer or 'auto'",
+                                "success": False}), 400
+
+        if open_practice and domain and domain.upper() == 'ALL':
+            domain = None
+
+        # Correcting a sent paragraph needs a valid one to fall back on
+        if auto_detect and not open_practice:
+            paragraph_text, error = trainer.get_paragraph_text(domain, paragraph_number)
+            if paragraph_text is None:
+                return jsonify({"error": error, "success": False}), 400
 
         # --- File Handling ---
         temp_filename = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.wav")
         audio_file.save(temp_filename)
 
         # --- Analysis ---
-        print(f"🎤 Analyzing audio for domain: {domain}, paragraph: {paragraph_number}")
-        # This method handles loading the audio, resampling, and calling analyze_pronunciation.
-        result = trainer.analyze_from_audio_file(temp_filename, domain, paragraph_number)
+        print(f"🎤 Analyzing audio for domain: {domain or 'ALL'}, paragraph: "
+              f"{'auto' if auto_detect else paragraph_number}")
+        # These methods handle loading the audio, resampling, and running the analysis.
+        analyze = trainer.analyze_auto_detect_from_audio_file if auto_detect else trainer.analyze_from_audio_file
+
+        if profiler.should_profile():
+            with profiler.capture(domain=domain, paragraph_number=paragraph_number, auto_detect=auto_detect):
+                result = analyze(temp_filename, domain, paragraph_number)
+        else:
+            result = analyze(temp_filename, domain, paragraph_number)
 
         # --- Response ---
         if result.get('success'):
             return jsonify(result)
+        elif result.get('detected') is False:
+            # The recording did not clearly match any paragraph; the client should ask which one
+            return jsonify(result), 422
         else:
             return jsonify(result), 500
 
@@ -101,5 +292,137 @@ def analyze_audio():
                 # Log the error but don't prevent the response from being sent
                 print(f"⚠️ Error deleting temporary file {temp_filename}: {e.strerror}")
 
+
+@app.route('/drill', methods=['POST'])
+def drill_word():
+    """
+    Low-latency single-word drill. Expects a multipart form with:
+    - 'audio_file': A short .wav clip (at most a few seconds) of the learner saying the word.
+    - 'word': The target word (e.g., 'BIODIVERSITY').
+    """
+    temp_filename = None
+    if not model_status["ready"]:
+        return _not_ready_response()
+    try:
+        # --- Input Validation ---
+        if 'audio_file' not in request.files:
+            return jsonify({"error": "No audio file part in the request", "success": False}), 400
+
+        audio_file = request.files['audio_file']
+        word = request.form.get('word')
+
+        if not audio_file or audio_file.filename == '':
+            return jsonify({"error": "No selected audio file", "success": False}), 400
+        if not word:
+            return jsonify({"error": "'word' is a required field", "success": False}), 400
+
+        # --- File Handling ---
+        temp_filename = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.wav")
+        audio_file.save(temp_filename)
+
+        # --- Analysis ---
+        result = trainer.analyze_word_drill_from_audio_file(temp_filename, word)
+
+        # --- Response ---
+        if result.get('success'):
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
+
+    except Exception as e:
+        print(f"An unexpected error occurred in the drill endpoint: {e}")
+        return jsonify({"error": "An internal server error occurred.", "success": False, "details": str(e)}), 500
+
+    finally:
+        # --- Cleanup ---
+        if temp_filename and os.path.exists(temp_filename):
+            try:
+                os.remove(temp_filename)
+            except OSError as e:
+                print(f"⚠️ Error deleting temporary file {temp_filename}: {e.strerror}")
+
+
+@sock.route('/stream')
+def stream_audio(ws):
+    """
+    Live pronunciation analysis over a WebSocket. Protocol:
+    - Client sends a JSON text message first:
+      {"type": "start", "domain": "SOCIAL", "paragraph_number": 1, "sample_rate": 16000}
+    - Client then sends binary messages of mono float32 little-endian PCM samples.
+    - Server pushes {"type": "provisional", ...} word verdicts as the learner moves through the paragraph.
+    - Client sends {"type": "end"} after the last frame and receives {"type": "final", "result": {...}}
+      where result matches the /analyze response.
+    """
+    if not model_status["ready"]:
+        ws.send(json.dumps({"type": "error", "error": "The pronunciation model is still loading. Please retry shortly.",
+                            "retry_after": RETRY_AFTER_SECONDS, "success": False}))
+        return
+
+    session = None
+    try:
+        # --- Session Setup ---
+        try:
+            start = json.loads(ws.receive())
+            domain = start['domain']
+            paragraph_number = int(start['paragraph_number'])
+            sample_rate = int(start.get('sample_rate', 16000))
+            if sample_rate not in SUPPORTED_STREAM_SAMPLE_RATES:
+                raise ValueError(f"Unsupported sample rate: {sample_rate}")
+        except (ValueError, TypeError, KeyError):
+            ws.send(json.dumps({"type": "error", "success": False,
+                                "error": "First message must be JSON with 'domain', 'paragraph_number' and optional "
+                                         f"'sample_rate' (one of {', '.join(map(str, SUPPORTED_STREAM_SAMPLE_RATES))})"}))
+            return
+
+        session, error = trainer.create_streaming_session(domain, paragraph_number, sample_rate=sample_rate)
+        if session is None:
+            ws.send(json.dumps({"type": "error", "error": error, "success": False}))
+            return
+
+        print(f"🎙️ Streaming analysis started for domain: {domain}, paragraph: {paragraph_number}")
+        ws.send(json.dumps({"type": "ready", "success": True}))
+
+        # --- Audio Frames ---
+        while True:
+            message = ws.receive()
+            if isinstance(message, str):
+                if json.loads(message).get('type') == 'end':
+                    break
+                continue
+
+            # Enforce the limit before any resampling or inference on this message
+            if (session.samples_received + len(message) // 4) / sample_rate > MAX_STREAM_SECONDS:
+                ws.send(json.dumps({"type": "error", "success": False,
+                                    "error": f"Recording exceeds the {MAX_STREAM_SECONDS} second limit"}))
+                return
+
+            update = session.add_audio(np.frombuffer(message, dtype='<f4'))
+            if update:
+                ws.send(json.dumps({"type": "provisional", **update}))
+
+        # --- Final Report ---
+        finish_started = time.monotonic()
+        result = session.finish()
+        print(f"✅ Streaming analysis finished {time.monotonic() - finish_started:.3f}s after the last frame "
+              f"({session.duration_seconds:.1f}s of audio)")
+        ws.send(json.dumps({"type": "final", "result": result, "success": result.get('success', False)}))
+
+    except Exception as e:
+        print(f"An unexpected error occurred in the streaming endpoint: {e}")
+        try:
+            ws.send(json.dumps({"type": "error", "error": "An internal server error occurred.",
+                                "details": str(e), "success": False}))
+        except Exception:
+            pass
+
+
+print(f"🌐 API module loaded in {time.monotonic() - PROCESS_START:.2f}s; "
+      f"the server can bind while the model warms up in the background.")
+
 # To run this in production (e.g., on Windows), use a WSGI server from your terminal:
-# waitress-serve --host=0.0.0.0 --port=5000 api:app
\ No newline at end of file
+# waitress-serve --host=0.0.0.0 --port=5000 api:app
+# The /stream WebSocket endpoint needs a server that hands over the raw socket, such as
+# gunicorn with threads (gunicorn -k gthread --threads 8 -b 0.0.0.0:5000 api:app) or the
+# built-in server below. Waitress only serves the plain HTTP endpoints.
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, threaded=True)
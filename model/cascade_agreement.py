@@ -0,0 +1,79 @@
+import argparse
+import json
+import torch
+import torchaudio
+from model import MultiDomainPronunciationTrainer
+
+# Measures how often the fast cascade tier reaches the same verdicts as the full model.
+# The manifest is a JSON list of recordings:
+#   [{"audio_file": "recordings/a.wav", "domain": "SOCIAL", "paragraph_number": 1}, ...]
+# Example:
+#   python cascade_agreement.py recordings.json --fast-layers 6 --min-confidence 0.85
+
+parser = argparse.ArgumentParser(description="Compare fast-tier and full-model pronunciation verdicts")
+parser.add_argument("manifest", help="JSON list of {audio_file, domain, paragraph_number}")
+parser.add_argument("--fast-model", default=None, help="Hugging Face name of the fast model (default: truncated copy)")
+parser.add_argument("--fast-layers", type=int, default=6, help="Transformer layers kept in the truncated fast tier")
+parser.add_argument("--min-confidence", type=float, default=0.85)
+parser.add_argument("--min-accuracy", type=float, default=85.0)
+parser.add_argument("--output", default=None, help="Optional path for the per-recording JSON report")
+args = parser.parse_args()
+
+print("🚀 Loading the full model and building the fast tier...")
+trainer = MultiDomainPronunciationTrainer()
+trainer.load_and_initialize_model()
+try:
+    trainer.model.load_state_dict(torch.load('model_state.pth'))
+    print("✅ Loaded fine-tuned weights from 'model_state.pth'.")
+except FileNotFoundError:
+    print("⚠️  'model_state.pth' not found. Comparing against the standard pre-trained model.")
+trainer.enable_cascade(fast_model_name=args.fast_model, fast_num_layers=args.fast_layers,
+                       min_confidence=args.min_confidence, min_word_accuracy=args.min_accuracy)
+
+with open(args.manifest) as manifest_file:
+    recordings = json.load(manifest_file)
+
+reports = []
+for recording in recordings:
+    paragraph_text, paragraph_title = trainer.get_paragraph_text(recording["domain"],
+                                                                 int(recording["paragraph_number"]))
+    if paragraph_text is None:
+        print(f"⚠️ Skipping {recording['audio_file']}: {paragraph_title}")
+        continue
+
+    waveform, sample_rate = torchaudio.load(recording["audio_file"])
+    if waveform.shape[0] > 1:
+        waveform = waveform.mean(dim=0, keepdim=True)
+    if sample_rate != 16000:
+        waveform = torchaudio.functional.resample(waveform, sample_rate, 16000)
+
+    comparison = trainer.compare_cascade_tiers(waveform.squeeze(0).numpy(), 16000, paragraph_text)
+    comparison["audio_file"] = recording["audio_file"]
+    reports.append(comparison)
+    print(f"🎤 {recording['audio_file']}: word agreement {comparison['word_verdict_agreement']:.1%}, "
+          f"grades {comparison['tiers']['fast']['grade']}/{comparison['tiers']['full']['grade']}, "
+          f"escalate={comparison['would_escalate']}")
+
+if not reports:
+    print("❌ No recordings were compared.")
+    raise SystemExit(1)
+
+# Agreement on the recordings the cascade would NOT escalate is what learners actually see
+kept = [report for report in reports if not report["would_escalate"]]
+fast_ms = sum(report["tiers"]["fast"]["latency_ms"] for report in reports) / len(reports)
+full_ms = sum(report["tiers"]["full"]["latency_ms"] for report in reports) / len(reports)
+
+print("\n📊 Cascade agreement summary")
+print(f"   Recordings compared:          {len(reports)}")
+print(f"   Word verdict agreement (all): {sum(r['word_verdict_agreement'] for r in reports) / len(reports):.1%}")
+print(f"   Grade agreement (all):        {sum(r['grade_agrees'] for r in reports) / len(reports):.1%}")
+print(f"   Escalation rate:              {1 - len(kept) / len(reports):.1%}")
+if kept:
+    print(f"   Word verdict agreement (kept):{sum(r['word_verdict_agreement'] for r in kept) / len(kept):.1%}")
+    print(f"   Grade agreement (kept):       {sum(r['grade_agrees'] for r in kept) / len(kept):.1%}")
+print(f"   Avg latency fast / full:      {fast_ms:.1f} ms / {full_ms:.1f} ms")
+
+if args.output:
+    with open(args.output, 'w') as output_file:
+        json.dump(reports, output_file, indent=2)
+    print(f"\n✅ Per-recording report saved to '{args.output}'")
@@ -10,12 +10,20 @@ import json
 import os
 from datetime import datetime
 import logging
+import threading
+import time
+import copy
+import math
+from profiling import profile_stage, record_profile_metadata
 
 # Suppress all warnings including transformers warnings
 warnings.filterwarnings("ignore")
 logging.getLogger("transformers").setLevel(logging.ERROR)
 os.environ["TRANSFORMERS_VERBOSITY"] = "error"
 
+# Shortest input the Wav2Vec2 feature encoder accepts (receptive field of the first convolution)
+MIN_WAV2VEC2_SAMPLES = 400
+
 
 class MultiDomainPronunciationTrainer:
     """
@@ -23,10 +31,25 @@ class MultiDomainPronunciationTrainer:
     Supports Social, Sports, Environment, and Politics domains with 4 paragraphs each
     """
 
+    # Single-word drills are capped so the lean path can reuse one preallocated buffer
+    DRILL_MAX_SECONDS = 4.0
+    DRILL_SAMPLE_RATE = 16000
+
+    # Open practice only trusts a detected paragraph that beats the runner-up by this much
+    MIN_DETECTION_MARGIN = 0.05
+
     def __init__(self):
         self.processor = None
         self.model = None
         self.is_trained = False
+        self._drill_buffer = None
+        self._drill_lock = threading.Lock()
+        self.fast_model = None
+        self.cascade_settings = None
+        self._cascade_stats = None
+        self._cascade_lock = threading.Lock()
+        self._candidate_cache = {}
+        self._full_seconds_per_audio_second = None
         self.domains = self._initialize_domains()
         self.phonetic_dict = self._load_comprehensive_phonetic_dictionary()
 
@@ -218,6 +241,10 @@ class MultiDomainPronunciationTrainer:
         # Perform comprehensive initialization to eliminate all warnings
         self._comprehensive_model_initialization()
 
+        # Preallocate the single-word drill input buffer and warm up that path once
+        self._drill_buffer = torch.zeros(1, int(self.DRILL_MAX_SECONDS * self.DRILL_SAMPLE_RATE))
+        self._transcribe_drill_clip(np.zeros(self.DRILL_SAMPLE_RATE, dtype=np.float32))
+
         self.is_trained = True
         print("✅ Advanced pronunciation model loaded and ready!")
         print("📚 Multi-domain phonetic dictionary loaded")
@@ -268,18 +295,28 @@ class MultiDomainPronunciationTrainer:
             raise RuntimeError("Model not loaded! Call load_and_initialize_model() first.")
 
         try:
-            # Get basic transcription
-            basic_result = self._get_basic_transcription(audio_array, sample_rate, reference_text)
+            if self.fast_model is not None:
+                # Score with the fast tier first and escalate anything that is not clearly clean
+                basic_result, word_analysis, _ = self._run_cascade(
+                    audio_array, sample_rate,
+                    lambda predicted_text, avg_confidence: self._score_against_paragraph(
+                        predicted_text, avg_confidence, reference_text))
+            else:
+                # Get basic transcription
+                with profile_stage("transcription"):
+                    basic_result = self._get_basic_transcription(audio_array, sample_rate, reference_text)
 
-            if not basic_result['success']:
-                return basic_result
+                if not basic_result['success']:
+                    return basic_result
 
-            # Perform word-level analysis
-            word_analysis = self._analyze_word_level(reference_text, basic_result['predicted_text'])
+                # Perform word-level analysis
+                with profile_stage("word_analysis"):
+                    word_analysis = self._analyze_word_level(reference_text, basic_result['predicted_text'])
 
             # Create comprehensive JSON result
-            json_result = self._create_json_result(basic_result, word_analysis, reference_text,
-                                                   domain, paragraph_number, paragraph_title)
+            with profile_stage("json_result"):
+                json_result = self._create_json_result(basic_result, word_analysis, reference_text,
+                                                       domain, paragraph_number, paragraph_title)
 
             return json_result
 
@@ -299,10 +336,27 @@ class MultiDomainPronunciationTrainer:
                 # If paragraph/domain is invalid, paragraph_title will contain the error message
                 return {"error": paragraph_title, "success": False}
 
-            # Load the audio file using torchaudio
+            audio_array, sample_rate = self._load_audio_file(audio_file_path)
+
+            # Call the core analysis function
+            result = self.analyze_pronunciation(audio_array, sample_rate, paragraph_text, domain, paragraph_number,
+                                                paragraph_title)
+            return result
+        except Exception as e:
+            return {"error": f"Could not process audio file: {str(e)}", "success": False}
+
+    # --- END OF NEW METHOD ---
+
+    def _load_audio_file(self, audio_file_path):
+        """Load an audio file as a mono 16 kHz NumPy array"""
+        # Load the audio file using torchaudio
+        with profile_stage("load_audio"):
             waveform, sample_rate = torchaudio.load(audio_file_path)
+        record_profile_metadata(audio_duration_seconds=round(waveform.shape[-1] / sample_rate, 3),
+                                original_sample_rate=sample_rate)
 
-            # --- Audio Preprocessing ---
+        # --- Audio Preprocessing ---
+        with profile_stage("preprocess"):
             # 1. Convert to mono if it's stereo
             if waveform.shape[0] > 1:
                 waveform = waveform.mean(dim=0, keepdim=True)
@@ -316,27 +370,515 @@ class MultiDomainPronunciationTrainer:
             # Convert the audio tensor to a NumPy array for the model
             audio_array = waveform.squeeze().numpy()
 
-            # Call the core analysis function
-            result = self.analyze_pronunciation(audio_array, sample_rate, paragraph_text, domain, paragraph_number,
-                                                paragraph_title)
-            return result
+        return audio_array, sample_rate
+
+    def analyze_auto_detect(self, audio_array, sample_rate, domain=None, requested_paragraph=None):
+        """
+        Open-practice analysis: work out which paragraph was read, then analyze it.
+        The model runs once (per cascade tier); the transcript is scored against every paragraph
+        in `domain` (or the whole catalog when domain is None) with a batched word-level edit
+        distance, and the best match gets the full analysis plus a confidence margin over the
+        runner-up. When no paragraph wins clearly, the valid `requested_paragraph` in `domain` is
+        analyzed instead (with "detected": False attached); without one, a "detected": False
+        error is returned.
+        """
+        if not self.is_trained:
+            raise RuntimeError("Model not loaded! Call load_and_initialize_model() first.")
+
+        try:
+            if domain is not None and domain.upper() not in self.domains:
+                return {"error": f"Domain '{domain.upper()}' not found", "success": False}
+
+            # The client's own paragraph is the fallback when detection is unclear
+            fallback = None
+            if domain is not None and requested_paragraph is not None and \
+                    self.get_paragraph_text(domain, requested_paragraph)[0] is not None:
+                fallback = (domain.upper(), requested_paragraph)
+
+            if self.fast_model is not None:
+                # Open practice goes through the cascade too; the paragraph is detected again
+                # from the full model's transcript when the fast result is escalated
+                basic_result, word_analysis, detection = self._run_cascade(
+                    audio_array, sample_rate,
+                    lambda predicted_text, avg_confidence: self._score_against_candidates(
+                        predicted_text, avg_confidence, domain, fallback))
+            else:
+                with profile_stage("transcription"):
+                    predicted_text, avg_confidence = self._transcribe(audio_array, sample_rate)
+                basic_result, word_analysis, detection = self._score_against_candidates(
+                    predicted_text, avg_confidence, domain, fallback)
+
+            detection["scope"] = domain.upper() if domain is not None else "ALL"
+            detection["requested_paragraph"] = requested_paragraph
+
+            if basic_result is None:
+                # Grading against a guessed paragraph would only produce a meaningless F
+                return {
+                    "error": "Could not tell which paragraph was read. Please choose the paragraph and try again.",
+                    "detected": False,
+                    "paragraph_detection": detection,
+                    "success": False
+                }
+
+            if detection["detected"]:
+                best_domain, best_number = detection["detected_domain"], detection["detected_paragraph"]
+            else:
+                best_domain, best_number = fallback
+            paragraph_text, paragraph_title = self.get_paragraph_text(best_domain, best_number)
+            with profile_stage("json_result"):
+                json_result = self._create_json_result(basic_result, word_analysis, paragraph_text,
+                                                       best_domain, best_number, paragraph_title)
+
+            json_result["paragraph_detection"] = detection
+            return json_result
+
+        except Exception as e:
+            return {"error": str(e), "success": False}
+
+    def _score_against_paragraph(self, predicted_text, avg_confidence, reference_text):
+        """Basic scores and word analysis of a transcript against a known paragraph"""
+        basic_result = self._score_transcription(predicted_text, avg_confidence, reference_text)
+        with profile_stage("word_analysis"):
+            word_analysis = self._analyze_word_level(reference_text, predicted_text)
+        return basic_result, word_analysis, None
+
+    def _score_against_candidates(self, predicted_text, avg_confidence, domain=None, fallback=None):
+        """
+        Detect the paragraph a transcript belongs to and score it against that paragraph.
+        When no paragraph matches clearly enough, the transcript is scored against the
+        `fallback` (domain, paragraph_number) if given, otherwise (None, None, detection) is returned.
+        """
+        with profile_stage("paragraph_detection"):
+            candidates, match_scores = self._score_paragraph_candidates(predicted_text, domain)
+
+        ranking = np.argsort(-match_scores, kind='stable')
+        best_domain, best_number = candidates[ranking[0]]
+        best_score = float(match_scores[ranking[0]])
+        runner_up_score = float(match_scores[ranking[1]]) if len(ranking) > 1 else 0.0
+        margin = best_score - runner_up_score
+        detected = best_score > 0 and margin >= self.MIN_DETECTION_MARGIN
+
+        detection = {
+            "detected": detected,
+            "detected_domain": best_domain if detected else None,
+            "detected_paragraph": best_number if detected else None,
+            "match_score": round(best_score, 4),
+            "confidence_margin": round(margin, 4),
+            "top_candidates": [
+                {"domain": candidates[i][0], "paragraph_number": candidates[i][1],
+                 "match_score": round(float(match_scores[i]), 4)}
+                for i in ranking[:3]
+            ]
+        }
+        if not detected:
+            if fallback is None:
+                return None, None, detection
+            detection["fell_back_to_requested"] = True
+            best_domain, best_number = fallback
+
+        paragraph_text, _ = self.get_paragraph_text(best_domain, best_number)
+        basic_result, word_analysis, _ = self._score_against_paragraph(predicted_text, avg_confidence,
+                                                                       paragraph_text)
+        return basic_result, word_analysis, detection
+
+    def analyze_auto_detect_from_audio_file(self, audio_file_path, domain=None, requested_paragraph=None):
+        """Load an audio file and run analyze_auto_detect on it"""
+        try:
+            audio_array, sample_rate = self._load_audio_file(audio_file_path)
+            return self.analyze_auto_detect(audio_array, sample_rate, domain, requested_paragraph)
         except Exception as e:
             return {"error": f"Could not process audio file: {str(e)}", "success": False}
 
-    # --- END OF NEW METHOD ---
+    def _get_paragraph_candidates(self, domain=None):
+        """
+        Encode candidate paragraphs as a padded matrix of word ids for batched alignment.
+        Built once per scope and cached, since the catalog never changes at runtime.
+        """
+        scope = domain.upper() if domain is not None else None
+        if scope in self._candidate_cache:
+            return self._candidate_cache[scope]
+
+        candidates = [
+            (domain_key, number)
+            for domain_key, domain_info in self.domains.items()
+            if scope is None or domain_key == scope
+            for number in domain_info['paragraphs']
+        ]
+        word_lists = [self.domains[d]['paragraphs'][n]['text'].upper().split() for d, n in candidates]
+
+        vocabulary = {}
+        lengths = np.array([len(words) for words in word_lists])
+        # -1 pads the shorter paragraphs; it never matches a transcript word
+        word_ids = np.full((len(candidates), lengths.max()), -1, dtype=np.int64)
+        for row, words in enumerate(word_lists):
+            word_ids[row, :len(words)] = [vocabulary.setdefault(word, len(vocabulary)) for word in words]
+
+        self._candidate_cache[scope] = (candidates, word_ids, lengths, vocabulary)
+        return self._candidate_cache[scope]
+
+    def _score_paragraph_candidates(self, predicted_text, domain=None):
+        """
+        Score a transcript against every candidate paragraph at once.
+        Runs the word-level Levenshtein DP over all candidates in parallel (one row per
+        transcript word) and returns 1 - word error rate for each candidate.
+        """
+        candidates, word_ids, lengths, vocabulary = self._get_paragraph_candidates(domain)
+        # -2 marks transcript words outside every candidate, so they match nothing
+        pred_ids = [vocabulary.get(word, -2) for word in predicted_text.upper().split()]
+
+        max_length = word_ids.shape[1]
+        positions = np.arange(max_length + 1)
+        # distances[c, i]: edit distance between the first i words of candidate c and the transcript so far
+        distances = np.tile(positions, (len(candidates), 1))
+
+        for j, pred_id in enumerate(pred_ids, start=1):
+            substitution = distances[:, :-1] + (word_ids != pred_id)
+            insertion = distances[:, 1:] + 1
+            best = np.empty_like(distances)
+            best[:, 0] = j
+            best[:, 1:] = np.minimum(substitution, insertion)
+            # Deletions chain along each row: new[i] = min over k <= i of best[k] + (i - k)
+            distances = np.minimum.accumulate(best - positions, axis=1) + positions
+
+        word_errors = distances[np.arange(len(candidates)), lengths]
+        return candidates, np.maximum(0.0, 1.0 - word_errors / lengths)
+
+    def analyze_word_drill(self, audio_array, sample_rate, target_word):
+        """
+        Lean single-word analysis for re-recording a word from words_needing_practice.
+        Skips paragraph alignment and the full JSON report; returns the verdict,
+        similarity, phonetic and tip for the target word.
+        """
+        if not self.is_trained:
+            raise RuntimeError("Model not loaded! Call load_and_initialize_model() first.")
+
+        try:
+            target_word = re.sub(r"[^A-Z']", "", str(target_word).upper())
+            if not target_word:
+                return {"error": "A target word is required", "success": False}
+            if sample_rate != self.DRILL_SAMPLE_RATE:
+                return {"error": f"Drill audio must be sampled at {self.DRILL_SAMPLE_RATE} Hz", "success": False}
+
+            audio_array = np.asarray(audio_array, dtype=np.float32).reshape(-1)
+            if audio_array.size > self._drill_buffer.shape[1]:
+                return {"error": f"Drill clips must be at most {self.DRILL_MAX_SECONDS:g} seconds", "success": False}
+
+            predicted_text, avg_confidence = self._transcribe_drill_clip(audio_array)
+
+            # The learner may add filler around the word, so score the closest detected word
+            pred_words = predicted_text.upper().split()
+            best_word, best_similarity = None, 0.0
+            for pred_word in pred_words:
+                similarity = 1.0 if pred_word == target_word else self._word_similarity(target_word, pred_word)
+                if best_word is None or similarity > best_similarity:
+                    best_word, best_similarity = pred_word, similarity
+
+            word_info = self._build_word_info(target_word, best_word, best_similarity)
+            return {
+                "word": target_word,
+                "verdict": "correct" if word_info["issue_type"] == "CORRECT" else "incorrect",
+                "issue_type": word_info["issue_type"],
+                "issue_description": word_info["issue_description"],
+                "detected_as": word_info["detected_as"],
+                "predicted_text": predicted_text,
+                "similarity_score": word_info["similarity_score"],
+                "confidence_score": round(avg_confidence * 100, 2),
+                "phonetic": word_info["phonetic_pronunciation"],
+                "tip": word_info["pronunciation_tip"],
+                "success": True
+            }
+        except Exception as e:
+            return {"error": str(e), "success": False}
+
+    def analyze_word_drill_from_audio_file(self, audio_file_path, target_word):
+        """Load a short drill clip from disk and run analyze_word_drill on it"""
+        try:
+            # Reject long clips from the header, before paying for the full decode
+            audio_info = torchaudio.info(audio_file_path)
+            if audio_info.num_frames and audio_info.num_frames / audio_info.sample_rate > self.DRILL_MAX_SECONDS:
+                return {"error": f"Drill clips must be at most {self.DRILL_MAX_SECONDS:g} seconds", "success": False}
+
+            waveform, sample_rate = torchaudio.load(audio_file_path)
+
+            # Some containers don't record their length, so check again after decoding
+            if waveform.shape[-1] / sample_rate > self.DRILL_MAX_SECONDS:
+                return {"error": f"Drill clips must be at most {self.DRILL_MAX_SECONDS:g} seconds", "success": False}
+
+            if waveform.shape[0] > 1:
+                waveform = waveform.mean(dim=0, keepdim=True)
+            if sample_rate != self.DRILL_SAMPLE_RATE:
+                waveform = torchaudio.functional.resample(waveform, sample_rate, self.DRILL_SAMPLE_RATE)
+
+            # Resampling can round up by a sample or two
+            audio_array = waveform.squeeze(0).numpy()[:self._drill_buffer.shape[1]]
+            return self.analyze_word_drill(audio_array, self.DRILL_SAMPLE_RATE, target_word)
+        except Exception as e:
+            return {"error": f"Could not process audio file: {str(e)}", "success": False}
+
+    def _transcribe_drill_clip(self, audio_array):
+        """
+        Forward a short clip through the preallocated drill buffer.
+        Normalizes in place the same way the Wav2Vec2 feature extractor does,
+        without going through the processor.
+        """
+        length = max(audio_array.size, MIN_WAV2VEC2_SAMPLES)
+
+        with self._drill_lock, torch.inference_mode():
+            input_values = self._drill_buffer[:, :length]
+            input_values.zero_()
+            input_values[0, :audio_array.size] = torch.from_numpy(audio_array)
+            input_values.sub_(input_values.mean()).div_(torch.sqrt(input_values.var(unbiased=False) + 1e-7))
+
+            logits = self.model(input_values).logits
+            confidences, predicted_ids = torch.max(torch.softmax(logits, dim=-1), dim=-1)
+            avg_confidence = confidences.mean().item()
+            predicted_text = self.processor.decode(predicted_ids[0])
+
+        return predicted_text, avg_confidence
+
+    def enable_cascade(self, fast_model_name=None, fast_num_layers=6, min_confidence=0.85,
+                       min_word_accuracy=85.0):
+        """
+        Put a small, fast CTC model in front of the full model.
+        Every request is scored by the fast tier first. Only clean readings keep the fast result:
+        a request is escalated to the full model when the fast tier's average max-probability
+        confidence is below `min_confidence` or its word accuracy is below `min_word_accuracy`.
+        Low accuracy is always escalated, because a failing fast tier looks exactly like a poor
+        reading and learners must not get a grade the full model never checked.
+        The fast tier is `fast_model_name` from Hugging Face if given (it must share the
+        processor's vocabulary), otherwise a copy of the loaded model truncated to its first
+        `fast_num_layers` transformer layers. Call this after any fine-tuned weights are loaded.
+        """
+        if not self.is_trained:
+            raise RuntimeError("Model not loaded! Call load_and_initialize_model() first.")
+
+        full_layers = self.model.config.num_hidden_layers
+        if not fast_model_name and not 1 <= fast_num_layers <= full_layers:
+            raise ValueError(f"fast_num_layers must be between 1 and {full_layers}, got {fast_num_layers}")
+
+        print("⚡ Building fast model tier for the cascade...")
+        if fast_model_name:
+            fast_model = Wav2Vec2ForCTC.from_pretrained(fast_model_name)
+            tier_name = fast_model_name
+        else:
+            fast_model = copy.deepcopy(self.model)
+            fast_model.wav2vec2.encoder.layers = fast_model.wav2vec2.encoder.layers[:fast_num_layers]
+            fast_model.config.num_hidden_layers = fast_num_layers
+            tier_name = f"Wav2Vec2-base-960h (first {fast_num_layers} layers)"
+        fast_model.eval()
 
-    def _get_basic_transcription(self, audio_array, sample_rate, reference_text):
-        """Get basic transcription and scores"""
-        inputs = self.processor(audio_array, sampling_rate=sample_rate, return_tensors="pt")
+        # Warm up the fast tier once, like the full model
+        with torch.no_grad():
+            fast_model(torch.zeros(1, 16000))
+
+        # Measure the full model's cost per second of audio once, so the savings estimate
+        # is available before any request has been escalated
+        baseline_audio = np.random.randn(4 * 16000).astype(np.float32)
+        self._transcribe(baseline_audio, 16000)
+        started = time.perf_counter()
+        self._transcribe(baseline_audio, 16000)
+        self._full_seconds_per_audio_second = (time.perf_counter() - started) / 4
+
+        self.fast_model = fast_model
+        self.cascade_settings = {
+            "fast_model": tier_name,
+            "min_confidence": min_confidence,
+            "min_word_accuracy": min_word_accuracy
+        }
+        self.reset_cascade_metrics()
+        print(f"✅ Cascade enabled with fast tier: {tier_name}")
+
+    def reset_cascade_metrics(self):
+        """Clear the escalation and latency counters"""
+        with self._cascade_lock:
+            self._cascade_stats = {
+                "requests": 0,
+                "escalations": 0,
+                "fast_only_audio_seconds": 0.0,
+                "fast_only_latency_seconds": 0.0,
+                "escalated_audio_seconds": 0.0,
+                "escalated_fast_latency_seconds": 0.0,
+                "escalated_full_latency_seconds": 0.0
+            }
+
+    def get_cascade_metrics(self):
+        """Escalation rate, per-tier latency and the estimated time saved by the fast tier"""
+        if self.fast_model is None:
+            return {"enabled": False}
+
+        with self._cascade_lock:
+            stats = dict(self._cascade_stats)
+
+        requests = stats["requests"]
+        escalations = stats["escalations"]
+        fast_only = requests - escalations
+        total_latency = (stats["fast_only_latency_seconds"] + stats["escalated_fast_latency_seconds"]
+                         + stats["escalated_full_latency_seconds"])
+
+        # Full-model cost per second of audio estimates what the fast-only requests would have
+        # cost without the cascade. Escalated requests measure it under real load; until there
+        # are any, the measurement taken in enable_cascade() is used.
+        if stats["escalated_audio_seconds"] > 0:
+            full_seconds_per_audio_second = stats["escalated_full_latency_seconds"] / stats["escalated_audio_seconds"]
+        else:
+            full_seconds_per_audio_second = self._full_seconds_per_audio_second
+        estimated_savings = (full_seconds_per_audio_second * stats["fast_only_audio_seconds"]
+                             - stats["fast_only_latency_seconds"] - stats["escalated_fast_latency_seconds"])
+
+        return {
+            "enabled": True,
+            "settings": self.cascade_settings,
+            "requests": requests,
+            "escalations": escalations,
+            "escalation_rate": round(escalations / requests, 4) if requests else None,
+            "avg_latency_ms": round(total_latency / requests * 1000, 2) if requests else None,
+            "avg_fast_only_latency_ms": round(stats["fast_only_latency_seconds"] / fast_only * 1000, 2)
+            if fast_only else None,
+            "avg_escalated_latency_ms": round((stats["escalated_fast_latency_seconds"]
+                                               + stats["escalated_full_latency_seconds"]) / escalations * 1000, 2)
+            if escalations else None,
+            "full_model_ms_per_audio_second": round(full_seconds_per_audio_second * 1000, 2),
+            "estimated_latency_saved_seconds": round(estimated_savings, 3)
+        }
+
+    def compare_cascade_tiers(self, audio_array, sample_rate, reference_text):
+        """
+        Score one recording with both tiers and report how well their verdicts agree.
+        Used by cascade_agreement.py to tune the escalation thresholds.
+        """
+        if self.fast_model is None:
+            raise RuntimeError("Cascade not enabled! Call enable_cascade() first.")
+
+        ref_words = reference_text.upper().split()
+        tiers, position_verdicts = {}, {}
+        for tier, model in (("fast", self.fast_model), ("full", self.model)):
+            started = time.perf_counter()
+            basic_result = self._get_basic_transcription(audio_array, sample_rate, reference_text, model=model)
+            word_analysis = self._analyze_word_level(reference_text, basic_result['predicted_text'])
+            position_verdicts[tier] = self._word_verdicts_by_position(ref_words, basic_result['predicted_text'])
+            tiers[tier] = {
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                "confidence_score": basic_result["confidence_score"],
+                "overall_score": basic_result["overall_score"],
+                "grade": self._get_performance_grade(basic_result["overall_score"]),
+                "word_accuracy_percentage": word_analysis["word_accuracy_percentage"],
+                "wrong_words": [word["word"] for word in word_analysis["mispronounced_words"]]
+            }
+
+        # Compare per reference position, so repeated words like AND/THE are judged separately
+        agreeing_words = sum(1 for fast_verdict, full_verdict in zip(position_verdicts["fast"], position_verdicts["full"])
+                             if fast_verdict == full_verdict)
+
+        return {
+            "tiers": tiers,
+            "word_verdict_agreement": round(agreeing_words / len(ref_words), 4) if ref_words else None,
+            "grade_agrees": tiers["fast"]["grade"] == tiers["full"]["grade"],
+            "would_escalate": self._should_escalate(tiers["fast"]["confidence_score"],
+                                                    tiers["fast"]["word_accuracy_percentage"])
+        }
+
+    def _should_escalate(self, confidence_score, word_accuracy_percentage):
+        """Decide whether a fast-tier result is not clearly clean enough to return"""
+        settings = self.cascade_settings
+        return (confidence_score < settings["min_confidence"] * 100
+                or word_accuracy_percentage < settings["min_word_accuracy"])
+
+    def _word_verdicts_by_position(self, ref_words, predicted_text):
+        """Issue type for each reference word position, in reference order"""
+        pred_words = predicted_text.upper().split() if predicted_text else []
+        verdicts = []
+        for ref_word, pred_word in zip(ref_words, self._pair_words_by_position(ref_words, pred_words)):
+            similarity = self._word_similarity(ref_word, pred_word) if pred_word else 0.0
+            verdicts.append(self._build_word_info(ref_word, pred_word, similarity)["issue_type"])
+        return verdicts
+
+    def _run_cascade(self, audio_array, sample_rate, score_transcript):
+        """
+        Score with the fast tier and escalate to the full model unless the reading is clearly clean.
+        `score_transcript(predicted_text, avg_confidence)` returns (basic_result, word_analysis, details);
+        a None basic_result means the fast transcript could not be scored and is always escalated.
+        """
+        audio_seconds = len(audio_array) / sample_rate
+
+        fast_started = time.perf_counter()
+        with profile_stage("transcription_fast"):
+            predicted_text, avg_confidence = self._transcribe(audio_array, sample_rate, model=self.fast_model)
+        basic_result, word_analysis, details = score_transcript(predicted_text, avg_confidence)
+        fast_latency = time.perf_counter() - fast_started
+
+        escalated = basic_result is None or self._should_escalate(basic_result["confidence_score"],
+                                                                  word_analysis["word_accuracy_percentage"])
+        full_latency = 0.0
+        if escalated:
+            full_started = time.perf_counter()
+            with profile_stage("transcription"):
+                predicted_text, avg_confidence = self._transcribe(audio_array, sample_rate)
+            basic_result, word_analysis, details = score_transcript(predicted_text, avg_confidence)
+            full_latency = time.perf_counter() - full_started
+
+        if basic_result is not None:
+            basic_result["model_tier"] = "full" if escalated else "fast"
+
+        with self._cascade_lock:
+            stats = self._cascade_stats
+            stats["requests"] += 1
+            if escalated:
+                stats["escalations"] += 1
+                stats["escalated_audio_seconds"] += audio_seconds
+                stats["escalated_fast_latency_seconds"] += fast_latency
+                stats["escalated_full_latency_seconds"] += full_latency
+            else:
+                stats["fast_only_audio_seconds"] += audio_seconds
+                stats["fast_only_latency_seconds"] += fast_latency
+
+        return basic_result, word_analysis, details
+
+    def create_streaming_session(self, domain, paragraph_number, sample_rate=16000, chunk_seconds=1.0,
+                                 left_context_seconds=1.5):
+        """
+        Start a live analysis session for a paragraph. Audio is fed in while the learner
+        speaks and the model runs on each chunk as it arrives, so the final report is
+        ready almost immediately after the last frame.
+        Returns (session, None) on success or (None, error_message).
+        """
+        if not self.is_trained:
+            raise RuntimeError("Model not loaded! Call load_and_initialize_model() first.")
+
+        paragraph_text, paragraph_title = self.get_paragraph_text(domain, paragraph_number)
+        if paragraph_text is None:
+            return None, paragraph_title
+
+        session = StreamingPronunciationSession(self, paragraph_text, domain, paragraph_number, paragraph_title,
+                                                sample_rate=sample_rate, chunk_seconds=chunk_seconds,
+                                                left_context_seconds=left_context_seconds)
+        return session, None
+
+    def _get_basic_transcription(self, audio_array, sample_rate, reference_text, model=None):
+        """Get basic transcription and scores (with the full model unless another tier is given)"""
+        predicted_text, avg_confidence = self._transcribe(audio_array, sample_rate, model)
+        return self._score_transcription(predicted_text, avg_confidence, reference_text)
+
+    def _transcribe(self, audio_array, sample_rate, model=None):
+        """Run one forward pass and return the decoded text and average max-probability confidence"""
+        model = model if model is not None else self.model
+
+        with profile_stage("feature_extraction"):
+            inputs = self.processor(audio_array, sampling_rate=sample_rate, return_tensors="pt")
 
         with torch.no_grad():
-            logits = self.model(inputs.input_values).logits
+            with profile_stage("model_forward"):
+                logits = model(inputs.input_values).logits
             predicted_ids = torch.argmax(logits, dim=-1)
             probs = torch.softmax(logits, dim=-1)
             confidences = torch.max(probs, dim=-1)[0]
             avg_confidence = confidences.mean().item()
 
-        predicted_text = self.processor.decode(predicted_ids[0])
+        with profile_stage("ctc_decode"):
+            predicted_text = self.processor.decode(predicted_ids[0])
+        return predicted_text, avg_confidence
+
+    def _score_transcription(self, predicted_text, avg_confidence, reference_text):
+        """Combine text similarity and model confidence into the basic result"""
         similarity_score = self._calculate_similarity(reference_text, predicted_text)
         final_score = (similarity_score * 0.7 + avg_confidence * 100 * 0.3)
 
@@ -361,26 +903,11 @@ class MultiDomainPronunciationTrainer:
         mispronounced_words = []
 
         for ref_word, pred_word, similarity in aligned_words:
-            word_info = {
-                "word": ref_word,
-                "detected_as": pred_word if pred_word else "NOT_DETECTED",
-                "similarity_score": round(similarity, 3),
-                "phonetic_pronunciation": self.phonetic_dict.get(ref_word, "Not available"),
-                "pronunciation_tip": self._get_pronunciation_tips(ref_word)
-            }
+            word_info = self._build_word_info(ref_word, pred_word, similarity)
 
-            if pred_word is None:
-                word_info["issue_type"] = "MISSING"
-                word_info["issue_description"] = "Word not detected in speech"
-                mispronounced_words.append(word_info)
-            elif similarity > 0.7:  # Good pronunciation threshold
-                word_info["issue_type"] = "CORRECT"
-                word_info["issue_description"] = "Correctly pronounced"
+            if word_info["issue_type"] == "CORRECT":
                 correctly_pronounced.append(word_info)
             else:
-                word_info["issue_type"] = "MISPRONOUNCED" if similarity > 0.3 else "SEVERELY_MISPRONOUNCED"
-                word_info[
-                    "issue_description"] = "Pronunciation unclear" if similarity > 0.3 else "Significantly mispronounced"
                 mispronounced_words.append(word_info)
 
         return {
@@ -390,6 +917,29 @@ class MultiDomainPronunciationTrainer:
             "word_accuracy_percentage": round((len(correctly_pronounced) / len(ref_words)) * 100, 2) if ref_words else 0
         }
 
+    def _build_word_info(self, ref_word, pred_word, similarity):
+        """Build the verdict for a single aligned reference word"""
+        word_info = {
+            "word": ref_word,
+            "detected_as": pred_word if pred_word else "NOT_DETECTED",
+            "similarity_score": round(similarity, 3),
+            "phonetic_pronunciation": self.phonetic_dict.get(ref_word, "Not available"),
+            "pronunciation_tip": self._get_pronunciation_tips(ref_word)
+        }
+
+        if pred_word is None:
+            word_info["issue_type"] = "MISSING"
+            word_info["issue_description"] = "Word not detected in speech"
+        elif similarity > 0.7:  # Good pronunciation threshold
+            word_info["issue_type"] = "CORRECT"
+            word_info["issue_description"] = "Correctly pronounced"
+        else:
+            word_info["issue_type"] = "MISPRONOUNCED" if similarity > 0.3 else "SEVERELY_MISPRONOUNCED"
+            word_info[
+                "issue_description"] = "Pronunciation unclear" if similarity > 0.3 else "Significantly mispronounced"
+
+        return word_info
+
     def _create_json_result(self, basic_result, word_analysis, reference_text, domain, paragraph_number,
                             paragraph_title):
         """Create comprehensive JSON result with domain information"""
@@ -419,6 +969,7 @@ class MultiDomainPronunciationTrainer:
             "analysis_metadata": {
                 "timestamp": datetime.now().isoformat(),
                 "model_version": "Wav2Vec2-base-960h",
+                "model_tier": basic_result.get("model_tier", "full"),
                 "analysis_type": "multi_domain_pronunciation_analysis",
                 "practice_session": {
                     "domain": domain,
@@ -538,6 +1089,23 @@ class MultiDomainPronunciationTrainer:
 
         return aligned
 
+    def _pair_words_by_position(self, ref_words, pred_words, opcodes=None):
+        """
+        Detected word (or None) for each reference position, pairing words the same way
+        _align_words does but keeping exactly one entry per reference word.
+        """
+        if opcodes is None:
+            opcodes = difflib.SequenceMatcher(None, ref_words, pred_words).get_opcodes()
+
+        paired = [None] * len(ref_words)
+        for tag, i1, i2, j1, j2 in opcodes:
+            for i in range(i1, i2):
+                if tag == 'equal':
+                    paired[i] = pred_words[j1 + i - i1]
+                elif tag == 'replace':
+                    paired[i] = pred_words[min(j1 + i - i1, j2 - 1)]
+        return paired
+
     def _word_similarity(self, word1, word2):
         """Calculate similarity between two words"""
         if not word1 or not word2:
@@ -656,3 +1224,209 @@ class MultiDomainPronunciationTrainer:
         final_similarity = (char_similarity * 0.4 + word_similarity * 0.6) * 100
         return final_similarity
 
+
+class _StreamResampler:
+    """
+    Resamples a live stream in blocks so the output matches resampling the whole recording.
+    Each block is resampled with real neighbouring samples on both sides (zeros only at the
+    true start and end), and the blocks are cut on the exact input/output sample grid.
+    """
+
+    def __init__(self, orig_freq, new_freq):
+        divisor = math.gcd(orig_freq, new_freq)
+        self.orig_freq, self.new_freq = orig_freq, new_freq
+        self.orig_step, self.new_step = orig_freq // divisor, new_freq // divisor
+        # Half-width of torchaudio's default sinc kernel, in input samples, rounded up to the grid
+        kernel_width = math.ceil(6 * self.orig_step / (0.99 * min(self.orig_step, self.new_step)))
+        self.overlap = self.orig_step * math.ceil((kernel_width + 1) / self.orig_step)
+        self.history = np.zeros(self.overlap, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, audio, final=False):
+        """Feed input samples and return every output sample that is now fully determined"""
+        self.samples_in += audio.size
+        self.pending = np.concatenate([self.pending, audio])
+
+        if final:
+            # Pad to the grid and add silence as right context, like the offline edge
+            block_length = math.ceil(self.pending.size / self.orig_step) * self.orig_step
+            right = np.zeros(block_length + self.overlap - self.pending.size, dtype=np.float32)
+            window_tail = np.concatenate([self.pending, right])
+        else:
+            # Hold back enough samples to serve as right context for this block
+            block_length = (self.pending.size - self.overlap) // self.orig_step * self.orig_step
+            if block_length <= 0:
+                return np.zeros(0, dtype=np.float32)
+            window_tail = self.pending[:block_length + self.overlap]
+
+        window = np.concatenate([self.history, window_tail])
+        resampled = torchaudio.functional.resample(torch.from_numpy(window), self.orig_freq, self.new_freq).numpy()
+        skip = self.overlap // self.orig_step * self.new_step
+        output = resampled[skip:skip + block_length // self.orig_step * self.new_step]
+
+        if final:
+            # Trim the grid padding back to the offline output length
+            output = output[:max(0, math.ceil(self.samples_in * self.new_freq / self.orig_freq) - self.samples_out)]
+            self.pending = np.zeros(0, dtype=np.float32)
+        else:
+            self.history = window[block_length:block_length + self.overlap]
+            self.pending = self.pending[block_length:]
+
+        self.samples_out += output.size
+        return output
+
+
+class StreamingPronunciationSession:
+    """
+    Incremental pronunciation analysis for one paragraph.
+    Each chunk is run through Wav2Vec2 together with a limited amount of left context,
+    and only the output frames belonging to the new audio are kept. Word verdicts are
+    reported as soon as the learner has moved past them, and finish() returns the same
+    JSON report as analyze_pronunciation().
+    """
+
+    MODEL_SAMPLE_RATE = 16000
+    SAMPLES_PER_FRAME = 320  # Wav2Vec2 feature encoder stride (20 ms at 16 kHz)
+
+    def __init__(self, trainer, reference_text, domain, paragraph_number, paragraph_title,
+                 sample_rate=16000, chunk_seconds=1.0, left_context_seconds=1.5):
+        self.trainer = trainer
+        self.reference_text = reference_text
+        self.domain = domain
+        self.paragraph_number = paragraph_number
+        self.paragraph_title = paragraph_title
+        self.sample_rate = sample_rate
+
+        self.ref_words = reference_text.upper().split()
+        self.chunk_samples = int(chunk_seconds * self.MODEL_SAMPLE_RATE)
+        # Keep the context a whole number of frames so chunk outputs line up
+        self.context_samples = int(left_context_seconds * self.MODEL_SAMPLE_RATE
+                                   ) // self.SAMPLES_PER_FRAME * self.SAMPLES_PER_FRAME
+
+        self.resampler = _StreamResampler(sample_rate, self.MODEL_SAMPLE_RATE) \
+            if sample_rate != self.MODEL_SAMPLE_RATE else None
+        self.context = np.zeros(0, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.predicted_ids = []
+        self.frame_confidences = []
+        self.words_settled = 0
+        self.samples_received = 0
+        self.finished = False
+
+    @property
+    def duration_seconds(self):
+        """Seconds of audio received so far"""
+        return self.samples_received / self.sample_rate
+
+    def add_audio(self, audio_array):
+        """
+        Append mono float32 samples at the session sample rate.
+        Returns a provisional update when new words have been settled, otherwise None.
+        """
+        if self.finished:
+            raise RuntimeError("Streaming session already finished")
+
+        audio = np.asarray(audio_array, dtype=np.float32).reshape(-1)
+        if audio.size == 0:
+            return None
+
+        self.samples_received += audio.size
+        if self.resampler is not None:
+            audio = self.resampler.process(audio)
+        self.pending = np.concatenate([self.pending, audio])
+
+        processed = False
+        while self.pending.size >= self.chunk_samples:
+            chunk = self.pending[:self.chunk_samples]
+            self.pending = self.pending[self.chunk_samples:]
+            self._process_chunk(chunk)
+            processed = True
+
+        return self._provisional_update() if processed else None
+
+    def finish(self):
+        """Process any remaining audio and return the full analysis result"""
+        if self.finished:
+            raise RuntimeError("Streaming session already finished")
+
+        try:
+            if self.resampler is not None:
+                self.pending = np.concatenate([self.pending, self.resampler.process(np.zeros(0, dtype=np.float32),
+                                                                                    final=True)])
+            if self.pending.size:
+                self._process_chunk(self.pending)
+                self.pending = np.zeros(0, dtype=np.float32)
+            self.finished = True
+
+            if not self.predicted_ids:
+                return {"error": "No audio received", "success": False}
+
+            predicted_text = self.trainer.processor.decode(self.predicted_ids)
+            avg_confidence = float(np.mean(self.frame_confidences))
+            basic_result = self.trainer._score_transcription(predicted_text, avg_confidence, self.reference_text)
+            word_analysis = self.trainer._analyze_word_level(self.reference_text, predicted_text)
+
+            return self.trainer._create_json_result(basic_result, word_analysis, self.reference_text,
+                                                    self.domain, self.paragraph_number, self.paragraph_title)
+        except Exception as e:
+            return {"error": str(e), "success": False}
+
+    def _process_chunk(self, chunk):
+        """Run the model on left context + chunk and keep only the frames for the chunk"""
+        window = np.concatenate([self.context, chunk])
+        if window.size < MIN_WAV2VEC2_SAMPLES:
+            window = np.pad(window, (0, MIN_WAV2VEC2_SAMPLES - window.size))
+
+        inputs = self.trainer.processor(window, sampling_rate=self.MODEL_SAMPLE_RATE, return_tensors="pt")
+
+        with torch.no_grad():
+            logits = self.trainer.model(inputs.input_values).logits[0]
+            # The frame starting one stride before the chunk needs samples past the previous
+            # window, so it was not emitted there; keep it from this window instead
+            logits = logits[max(self.context.size // self.SAMPLES_PER_FRAME - 1, 0):]
+            probs = torch.softmax(logits, dim=-1)
+            confidences, predicted_ids = torch.max(probs, dim=-1)
+
+        self.predicted_ids.extend(predicted_ids.tolist())
+        self.frame_confidences.extend(confidences.tolist())
+
+        if self.context_samples:
+            self.context = window[-self.context_samples:]
+
+    def _provisional_update(self):
+        """Report verdicts for reference words the learner has already moved past"""
+        predicted_text = self.trainer.processor.decode(self.predicted_ids)
+        pred_words = predicted_text.upper().split()
+
+        # The last matched reference word may still be in progress, so only words
+        # before it are settled
+        settled_ref = 0
+        matcher = difflib.SequenceMatcher(None, self.ref_words, pred_words)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                settled_ref = i2 - 1
+
+        if settled_ref <= self.words_settled:
+            return None
+
+        # One verdict per reference index, pairing words the same way _align_words does
+        paired = self.trainer._pair_words_by_position(self.ref_words, pred_words, matcher.get_opcodes())
+
+        new_words = []
+        for i in range(self.words_settled, settled_ref):
+            ref_word, pred_word = self.ref_words[i], paired[i]
+            similarity = self.trainer._word_similarity(ref_word, pred_word) if pred_word else 0.0
+            word_info = self.trainer._build_word_info(ref_word, pred_word, similarity)
+            word_info["position"] = i
+            new_words.append(word_info)
+        self.words_settled = settled_ref
+
+        return {
+            "predicted_text": predicted_text,
+            "words_settled": settled_ref,
+            "total_words": len(self.ref_words),
+            "new_words": new_words,
+            "audio_seconds": round(self.duration_seconds, 2)
+        }
@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+import torch
+
+# Per-thread stage recorder. It is only set while a request is being profiled, so when
+# profiling is off profile_stage() is one attribute lookup returning a shared no-op.
+_capture_state = threading.local()
+_NO_STAGE = nullcontext()
+
+
+class _StageTimer:
+    """Times one stage into the current capture and marks it in the torch trace"""
+
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = stages
+        self.record = torch.profiler.record_function(name)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.record.__enter__()
+
+    def __exit__(self, *exc_info):
+        self.record.__exit__(*exc_info)
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        self.stages[self.name] = round(self.stages.get(self.name, 0.0) + elapsed_ms, 3)
+        return False
+
+
+def profile_stage(name):
+    """Time a named stage of the current request when it is being profiled"""
+    stages = getattr(_capture_state, 'stages', None)
+    if stages is None:
+        return _NO_STAGE
+    return _StageTimer(name, stages)
+
+
+def record_profile_metadata(**metadata):
+    """Attach extra details (e.g. audio duration) to the current capture, if any"""
+    current = getattr(_capture_state, 'metadata', None)
+    if current is not None:
+        current.update(metadata)
+
+
+class _StackSampler(threading.Thread):
+    """Samples the Python stack of one thread and aggregates it in collapsed (flamegraph) format"""
+
+    def __init__(self, thread_id, interval_seconds):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """
+    On-demand profiling of /analyze requests.
+    When armed, it captures a torch profiler trace (Chrome trace format) and a Python
+    sampling profile (collapsed stacks for flamegraph tools) for the next N requests
+    or for a random fraction of requests, along with the per-stage timings.
+    """
+
+    def __init__(self, output_dir='profiles', sampling_interval_seconds=0.005):
+        self.output_dir = output_dir
+        self.sampling_interval_seconds = sampling_interval_seconds
+        self.remaining_requests = 0
+        self.sample_rate = 0.0
+        self.captured = 0
+        self._lock = threading.Lock()
+        self._capture_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.remaining_requests > 0 or self.sample_rate > 0
+
+    def configure(self, requests=0, sample_rate=0.0):
+        """Arm the profiler for the next `requests` requests and/or a random `sample_rate` fraction"""
+        if requests < 0:
+            raise ValueError("'requests' must not be negative")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("'sample_rate' must be between 0 and 1")
+
+        with self._lock:
+            self.remaining_requests = requests
+            self.sample_rate = sample_rate
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "remaining_requests": self.remaining_requests,
+            "sample_rate": self.sample_rate,
+            "captured": self.captured,
+            "output_dir": os.path.abspath(self.output_dir)
+        }
+
+    def should_profile(self):
+        """
+        Decide whether the current request is captured. Free when the profiler is disarmed.
+        A True result reserves the capture slot, so it must be followed by capture().
+        """
+        if not self.enabled:
+            return False
+
+        # The torch profiler is process-wide, so a request that overlaps a running capture
+        # is not profiled and does not use up one of the requested captures
+        if not self._capture_lock.acquire(blocking=False):
+            return False
+
+        with self._lock:
+            if self.remaining_requests > 0:
+                self.remaining_requests -= 1
+                return True
+            if random.random() < self.sample_rate:
+                return True
+
+        self._capture_lock.release()
+        return False
+
+    @contextmanager
+    def capture(self, **metadata):
+        """Profile the enclosed block and write the trace files when it finishes (after should_profile())"""
+        try:
+            capture_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{random.randrange(16 ** 6):06x}"
+            _capture_state.stages = {}
+            _capture_state.metadata = dict(metadata)
+            sampler = _StackSampler(threading.get_ident(), self.sampling_interval_seconds)
+
+            started = time.perf_counter()
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                        record_shapes=True) as torch_profile:
+                sampler.start()
+                try:
+                    yield capture_id
+                finally:
+                    sampler.stop()
+            total_ms = (time.perf_counter() - started) * 1000
+            self._write_capture(capture_id, torch_profile, sampler, total_ms)
+        finally:
+            _capture_state.stages = None
+            _capture_state.metadata = None
+            self._capture_lock.release()
+
+    def _write_capture(self, capture_id, torch_profile, sampler, total_ms):
+        """Write the Chrome trace, collapsed stacks and a JSON summary for one capture"""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base_path = os.path.join(self.output_dir, capture_id)
+
+            torch_profile.export_chrome_trace(f"{base_path}.trace.json")
+
+            with open(f"{base_path}.folded", 'w') as folded_file:
+                for stack, count in sorted(sampler.stacks.items()):
+                    folded_file.write(f"{stack} {count}\n")
+
+            top_operators = [
+                {
+                    "name": event.key,
+                    "calls": event.count,
+                    "self_cpu_ms": round(event.self_cpu_time_total / 1000, 3),
+                    "cpu_total_ms": round(event.cpu_time_total / 1000, 3)
+                }
+                for event in sorted(torch_profile.key_averages(), key=lambda e: e.self_cpu_time_total,
+                                    reverse=True)[:20]
+            ]
+
+            summary = {
+                "capture_id": capture_id,
+                "timestamp": datetime.now().isoformat(),
+                "total_ms": round(total_ms, 3),
+                "stages_ms": _capture_state.stages,
+                "request": _capture_state.metadata,
+                "python_samples": sampler.samples,
+                "top_operators": top_operators,
+                "files": {
+                    "chrome_trace": f"{base_path}.trace.json",
+                    "flamegraph_stacks": f"{base_path}.folded"
+                }
+            }
+            with open(f"{base_path}.json", 'w') as summary_file:
+                json.dump(summary, summary_file, indent=2)
+
+            self.captured += 1
+            print(f"🔬 Profile captured: {base_path}.json ({total_ms:.1f} ms)")
+        except Exception as e:
+            print(f"⚠️ Error writing profile {capture_id}: {e}")